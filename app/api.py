@@ -1,21 +1,71 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from pydantic import BaseModel, HttpUrl
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Hashable, Literal, Set, Tuple
 import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+import aiohttp
+import orjson
+from cachetools import TTLCache
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
 from crawl4ai.content_filter_strategy import PruningContentFilter
 from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
-from app.auth import get_api_key, router as auth_router, init_airtable
+from app.auth import (
+    get_api_key, router as auth_router, check_airtable_config,
+    init_airtable_in_background, close_airtable
+)
 
-# Initialize FastAPI app
-app = FastAPI(
-    title="Web Crawler API",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    openapi_url="/openapi.json"
+logger = logging.getLogger(__name__)
+
+# Limit concurrent page crawls across all endpoints and requests on this worker
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "10"))
+CRAWL_SEMAPHORE = asyncio.BoundedSemaphore(CRAWL_CONCURRENCY)
+
+# Cache of /crawl responses (in-flight crawls included), per worker
+CRAWL_CACHE_TTL = float(os.getenv("CRAWL_CACHE_TTL", "300"))
+CRAWL_CACHE = TTLCache(maxsize=1024, ttl=CRAWL_CACHE_TTL)
+
+# /markdown responses carry whole pages, so they get their own much smaller cache
+# and bodies above MARKDOWN_CACHE_MAX_CHARS are only shared while in flight
+MARKDOWN_CACHE_SIZE = int(os.getenv("MARKDOWN_CACHE_SIZE", "32"))
+MARKDOWN_CACHE_MAX_CHARS = int(os.getenv("MARKDOWN_CACHE_MAX_CHARS", "1000000"))
+MARKDOWN_CACHE = TTLCache(maxsize=MARKDOWN_CACHE_SIZE, ttl=CRAWL_CACHE_TTL)
+
+# /advanced page renders currently running on this worker, shared by concurrent requests;
+# entries are dropped as soon as a render finishes, so no markdown is retained
+RENDERS_IN_FLIGHT: Dict[Hashable, "InFlightRender"] = {}
+
+# Seconds resolved hostnames are cached by the link-probe HTTP client
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))
+
+# Maximum concurrent link probes to any one host, so /advanced does not trip rate limits
+PROBE_LIMIT_PER_HOST = int(os.getenv("PROBE_LIMIT_PER_HOST", "8"))
+
+# Probe as a browser would; many sites reject or challenge unknown HTTP clients
+PROBE_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# Probe statuses that mean the page is definitely gone
+GONE_STATUSES = frozenset({404, 410})
+
+# Link discovery settings are request-invariant, so build the config once
+CRAWL_CONFIG = CrawlerRunConfig(
+    exclude_external_links=False,
+    exclude_domains=[""],
+    exclude_social_media_links=False,
+    exclude_external_images=True,
+    wait_for_images=True,
+    verbose=False
 )
 
 # Define media extensions to filter out
@@ -33,35 +83,180 @@ media_extensions = {
     '.swf', '.woff', '.woff2', '.ttf', '.eot'
 }
 
+# Bare extensions for a single set lookup per URL
+_MEDIA_EXTS = frozenset(ext.lstrip('.') for ext in media_extensions)
+
 # Utility functions
+@lru_cache(maxsize=4096)
+def _normalize_lower(url: str) -> str:
+    """Normalize an already-lowercased URL."""
+    # Drop the fragment and split into components
+    url = url.partition('#')[0]
+    try:
+        scheme, netloc, path, query, _ = urlsplit(url)
+    except ValueError:
+        # Malformed host (e.g. "[server]" or an unclosed "["); scraped hrefs must never fail
+        return url.rstrip('/')
+    # Remove 'www.' and default ports from the host only
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    if netloc.endswith((':80', ':443')):
+        netloc = netloc.rpartition(':')[0]
+    # Ensure consistent protocol
+    if scheme == 'http':
+        scheme = 'https'
+    # Remove trailing slash from the path
+    path = path.rstrip('/')
+    if not scheme or not netloc:
+        # Relative or unusual URL, let urlunsplit handle the edge cases
+        return urlunsplit((scheme, netloc, path, query, ''))
+    return f"{scheme}://{netloc}{path}?{query}" if query else f"{scheme}://{netloc}{path}"
+
+def _is_media_lower(url: str) -> bool:
+    """Check if an already-lowercased URL points to a media file."""
+    # Only the path matters, so drop any fragment and query string first
+    path = url.partition('#')[0].partition('?')[0]
+    _, dot, ext = path.rpartition('.')
+    # The extension must belong to the last path segment
+    return bool(dot) and '/' not in ext and ext in _MEDIA_EXTS
+
 def normalize_url(url: str) -> str:
     """Normalize URL by removing fragments, trailing slashes, and standardizing protocol."""
-    # Remove any hash fragments first
-    url = url.split('#')[0]
-    # Remove trailing slash
-    url = url.rstrip('/')
-    # Remove 'www.' if present
-    url = url.replace('www.', '')
-    # Remove default ports
-    url = url.replace(':80/', '/').replace(':443/', '/')
-    # Ensure consistent protocol
-    if url.startswith('http://'):
-        url = 'https://' + url[7:]
-    return url.lower()
+    return _normalize_lower(url.lower())
+
+def canonical_url(url: str) -> str:
+    """
+    Canonicalize a URL for cache keys by lowercasing the scheme and host and dropping the fragment.
+    Unlike normalize_url the path and query keep their case, so distinct pages never share a key.
+    """
+    scheme, netloc, path, query, _ = urlsplit(url)
+    return urlunsplit((scheme.lower(), netloc.lower(), path, query, ''))
 
 def is_media_url(url: str) -> bool:
     """Check if URL points to a media file."""
-    lower_url = url.lower()
-    return any(lower_url.endswith(ext) for ext in media_extensions)
+    return _is_media_lower(url.lower())
 
 def is_same_url(url1: str, url2: str) -> bool:
     """Compare two URLs after normalization."""
     return normalize_url(url1) == normalize_url(url2)
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup."""
-    await init_airtable()
+@lru_cache(maxsize=32)
+def markdown_config(
+    threshold: float,
+    threshold_type: str,
+    min_word_threshold: int
+) -> CrawlerRunConfig:
+    """
+    Build a crawler config with a pruning markdown generator.
+    Cached per parameter set; the returned config is shared and must not be mutated.
+    """
+    prune_filter = PruningContentFilter(
+        threshold=threshold,
+        threshold_type=threshold_type,
+        min_word_threshold=min_word_threshold
+    )
+    md_generator = DefaultMarkdownGenerator(content_filter=prune_filter)
+    return CrawlerRunConfig(
+        markdown_generator=md_generator
+    )
+
+# Default content filter settings for /markdown and /advanced requests
+DEFAULT_THRESHOLD = 0.45
+DEFAULT_THRESHOLD_TYPE = "dynamic"
+DEFAULT_MIN_WORD_THRESHOLD = 5
+
+# Build the config for the default settings at import so no request pays for it
+markdown_config(DEFAULT_THRESHOLD, DEFAULT_THRESHOLD_TYPE, DEFAULT_MIN_WORD_THRESHOLD)
+
+async def probe_url(session: aiohttp.ClientSession, url: str) -> Optional[str]:
+    """
+    Check a URL over plain HTTP before rendering it in the browser.
+    Returns the redirect-resolved URL, or None if the page is definitely gone
+    (404/410) or is not HTML. Inconclusive probes (timeouts, other errors,
+    bot protection) return the URL so the browser can decide.
+    """
+    try:
+        async with session.head(url, allow_redirects=True) as response:
+            status = response.status
+            content_type = response.headers.get("Content-Type", "")
+            final_url = str(response.url)
+
+        # Some servers reject HEAD; fall back to fetching a single byte
+        if status >= 400 or not content_type:
+            async with session.get(url, headers={"Range": "bytes=0-0"}, allow_redirects=True) as response:
+                status = response.status
+                content_type = response.headers.get("Content-Type", "")
+                final_url = str(response.url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.debug("Probe inconclusive for %s, rendering anyway: %s", url, e)
+        return url
+
+    if status in GONE_STATUSES:
+        logger.debug("Skipping %s (status %s)", url, status)
+        return None
+    is_html = content_type.lower().startswith(("text/html", "application/xhtml+xml"))
+    if status < 300 and content_type and not is_html:
+        logger.debug("Skipping %s (content type %r)", url, content_type)
+        return None
+    if status >= 400:
+        logger.debug("Probe inconclusive for %s (status %s), rendering anyway", url, status)
+    return final_url
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize services on startup and release them on shutdown."""
+    # Missing Airtable settings will never fix themselves, so fail the deploy loudly;
+    # connect in the background so the worker can serve /health immediately
+    check_airtable_config()
+    airtable_init = asyncio.create_task(init_airtable_in_background())
+    logger.info("Event loop: %s", asyncio.get_running_loop().__class__)
+
+    # Start a single browser that is shared by every request on this worker
+    crawler = AsyncWebCrawler()
+    await crawler.__aenter__()
+    app.state.crawler = crawler
+
+    # Lightweight HTTP client used to probe links before rendering them
+    # (non-blocking, cached DNS and keep-alive connections reused across requests;
+    # page renders go through Chromium, which keeps its own host resolver cache)
+    app.state.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=PROBE_LIMIT_PER_HOST,
+            resolver=aiohttp.AsyncResolver(),
+            ttl_dns_cache=DNS_CACHE_TTL,
+            force_close=False
+        ),
+        # Time the connect and each read only; a total timeout would also count the time
+        # spent queued behind PROBE_LIMIT_PER_HOST and turn busy hosts into false timeouts
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=5),
+        headers={"User-Agent": PROBE_USER_AGENT}
+    )
+
+    try:
+        yield
+    finally:
+        await app.state.http_session.close()
+        await crawler.__aexit__(None, None, None)
+        airtable_init.cancel()
+        await close_airtable()
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="Web Crawler API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+    docs_url="/docs",
+    redoc_url="/redoc",
+    openapi_url="/openapi.json"
+)
+
+# Compress large responses (markdown payloads can run to several MB)
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=1024,
+    compresslevel=5
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -99,6 +294,19 @@ class LinkInfo(BaseModel):
     domain: str
     type: str
 
+@dataclass(slots=True)
+class Link:
+    """Lightweight link record built per anchor; LinkInfo documents its JSON schema."""
+    url: str
+    domain: str
+    type: str
+
+@dataclass(slots=True)
+class InFlightRender:
+    """A shared page render and the number of requests waiting on it."""
+    task: asyncio.Future
+    waiters: int = 0
+
 class CrawlResponse(BaseModel):
     success: bool
     url: str
@@ -109,9 +317,10 @@ class CrawlResponse(BaseModel):
 
 class MarkdownRequest(BaseModel):
     url: HttpUrl
-    threshold: Optional[float] = 0.45
-    threshold_type: Optional[str] = "dynamic"
-    min_word_threshold: Optional[int] = 5
+    threshold: Optional[float] = DEFAULT_THRESHOLD
+    threshold_type: Optional[str] = DEFAULT_THRESHOLD_TYPE
+    min_word_threshold: Optional[int] = DEFAULT_MIN_WORD_THRESHOLD
+    include_markdown: bool = True  # False returns only the markdown lengths
 
 class MarkdownResponse(BaseModel):
     success: bool
@@ -124,9 +333,10 @@ class MarkdownResponse(BaseModel):
 
 class AdvancedRequest(BaseModel):
     url: HttpUrl
-    threshold: Optional[float] = 0.45
-    threshold_type: Optional[str] = "dynamic"
-    min_word_threshold: Optional[int] = 5
+    threshold: Optional[float] = DEFAULT_THRESHOLD
+    threshold_type: Optional[str] = DEFAULT_THRESHOLD_TYPE
+    min_word_threshold: Optional[int] = DEFAULT_MIN_WORD_THRESHOLD
+    include_markdown: bool = True  # False returns only the markdown lengths
 
 class PageMarkdown(BaseModel):
     url: str
@@ -141,117 +351,346 @@ class AdvancedResponse(BaseModel):
     pages: List[PageMarkdown] = []
     error_message: Optional[str] = None
 
-@app.post("/crawl", response_model=CrawlResponse)
+def markdown_cacheable(body: Dict[str, Any]) -> bool:
+    """Keep successful /markdown bodies unless they are too large to hold for the TTL."""
+    return body["success"] and (
+        body["raw_markdown_length"] + body["fit_markdown_length"] <= MARKDOWN_CACHE_MAX_CHARS
+    )
+
+async def cached_crawl(
+    cache: TTLCache,
+    key: Hashable,
+    crawl: Callable[[], Awaitable[Dict[str, Any]]],
+    cacheable: Callable[[Dict[str, Any]], bool] = lambda body: body["success"]
+) -> Dict[str, Any]:
+    """
+    Return the response body cached for key, running crawl() if there is none.
+    Concurrent callers with the same key share a single in-flight crawl;
+    failed or non-cacheable results are dropped once done, so the next request retries.
+    """
+    future = cache.get(key)
+    if future is None:
+        future = asyncio.ensure_future(crawl())
+        cache[key] = future
+
+        def evict_if_failed(done: asyncio.Future):
+            # Runs even if every waiter was cancelled, and retrieves the exception
+            # so a failed crawl is neither cached nor logged as never retrieved
+            failed = (
+                done.cancelled()
+                or done.exception() is not None
+                or not cacheable(done.result())
+            )
+            if failed and cache.get(key) is done:
+                del cache[key]
+
+        future.add_done_callback(evict_if_failed)
+
+    # Shield the shared crawl so one client disconnecting does not cancel it for the others
+    return await asyncio.shield(future)
+
+def markdown_cache_key(
+    url: str,
+    threshold: float,
+    threshold_type: str,
+    min_word_threshold: int
+) -> Tuple[Any, ...]:
+    """Key for a markdown crawl of url with the given filter settings."""
+    return ("markdown", canonical_url(url), threshold, threshold_type, min_word_threshold)
+
+async def coalesced_render(
+    key: Hashable,
+    render: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """
+    Run render() once for all concurrent callers with the same key.
+    Nothing is kept once the render finishes, and the render is cancelled
+    (freeing its crawl slot) when its last caller is cancelled.
+    """
+    in_flight = RENDERS_IN_FLIGHT.get(key)
+    if in_flight is None:
+        in_flight = RENDERS_IN_FLIGHT[key] = InFlightRender(asyncio.ensure_future(render()))
+
+        def forget(done: asyncio.Future):
+            if not done.cancelled():
+                done.exception()  # Mark the result as retrieved
+            if RENDERS_IN_FLIGHT.get(key) is in_flight:
+                del RENDERS_IN_FLIGHT[key]
+
+        in_flight.task.add_done_callback(forget)
+
+    in_flight.waiters += 1
+    try:
+        # Shield the shared render so one caller leaving does not cancel it for the others
+        return await asyncio.shield(in_flight.task)
+    finally:
+        in_flight.waiters -= 1
+        if not in_flight.waiters and not in_flight.task.done():
+            # Nobody is waiting any more; drop it now so new callers start a fresh render
+            if RENDERS_IN_FLIGHT.get(key) is in_flight:
+                del RENDERS_IN_FLIGHT[key]
+            in_flight.task.cancel()
+
+async def crawl_links(input_url: str) -> Dict[str, Any]:
+    """Crawl a URL and build a CrawlResponse-shaped body of its deduplicated links and images."""
+    normalized_input_url = normalize_url(input_url)
+
+    async with CRAWL_SEMAPHORE:
+        result = await app.state.crawler.arun(input_url, config=CRAWL_CONFIG)
+
+    if result.success:
+        # Filter and format internal and external links in a single pass,
+        # keeping only the first occurrence of each normalized URL
+        links_by_type = {'internal': [], 'external': []}
+        seen = {normalized_input_url}
+        for link_type, bucket in links_by_type.items():
+            for link in result.links.get(link_type, []):
+                href = link['href']
+                href_lower = href.lower()
+                if _is_media_lower(href_lower):
+                    continue
+                normalized = _normalize_lower(href_lower)
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+                bucket.append(Link(href, link.get('domain', ''), link_type))
+
+        # Built directly as the response body; orjson serializes the Link dataclasses natively
+        return {
+            "success": True,
+            "url": result.url,
+            "internal_links": links_by_type['internal'],
+            "external_links": links_by_type['external'],
+            "images": [{
+                "src": img["src"],
+                "alt": img.get("alt", ""),
+                "score": img.get("score", "N/A")
+            } for img in result.media.get("images", [])],
+            "error_message": None
+        }
+    else:
+        return CrawlResponse(
+            success=False,
+            url=input_url,
+            error_message=result.error_message
+        ).model_dump()
+
+async def crawl_markdown(input_url: str, config: CrawlerRunConfig) -> Dict[str, Any]:
+    """Crawl a URL and build a MarkdownResponse body with its raw and filtered markdown."""
+    async with CRAWL_SEMAPHORE:
+        result = await app.state.crawler.arun(input_url, config=config)
+
+    if result.success:
+        raw_markdown = result.markdown_v2.raw_markdown
+        fit_markdown = result.markdown_v2.fit_markdown
+        return MarkdownResponse(
+            success=True,
+            url=input_url,
+            raw_markdown=raw_markdown,
+            fit_markdown=fit_markdown,
+            raw_markdown_length=len(raw_markdown),
+            fit_markdown_length=len(fit_markdown)
+        ).model_dump()
+    else:
+        return MarkdownResponse(
+            success=False,
+            url=input_url,
+            error_message=result.error_message
+        ).model_dump()
+
+@app.post("/crawl", responses={200: {"model": CrawlResponse}})
 async def crawl_url(request: CrawlRequest, api_key: str = Depends(get_api_key)):
     """
     Crawl a specified URL and return links and images.
+    Responses are cached per URL for CRAWL_CACHE_TTL seconds.
     Requires a valid API key in the X-API-Key header.
     """
     try:
-        crawler_cfg = CrawlerRunConfig(
-            exclude_external_links=False,
-            exclude_domains=[""],
-            exclude_social_media_links=False,
-            exclude_external_images=True,
-            wait_for_images=True,
-            verbose=True
-        )
-
         input_url = str(request.url)
-        normalized_input_url = normalize_url(input_url)
-
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(input_url, config=crawler_cfg)
-
-            if result.success:
-                # Filter and format internal links
-                internal_links = [
-                    LinkInfo(
-                        url=link['href'],
-                        domain=link.get('domain', ''),
-                        type='internal'
-                    ) for link in result.links.get("internal", [])
-                    if not is_media_url(link['href']) and not is_same_url(link['href'], input_url)
-                ]
-
-                # Filter and format external links
-                external_links = [
-                    LinkInfo(
-                        url=link['href'],
-                        domain=link.get('domain', ''),
-                        type='external'
-                    ) for link in result.links.get("external", [])
-                    if not is_media_url(link['href']) and not is_same_url(link['href'], input_url)
-                ]
-                
-                return CrawlResponse(
-                    success=True,
-                    url=result.url,
-                    internal_links=internal_links,
-                    external_links=external_links,
-                    images=[{
-                        "src": img["src"],
-                        "alt": img.get("alt", ""),
-                        "score": img.get("score", "N/A")
-                    } for img in result.media.get("images", [])]
-                )
-            else:
-                return CrawlResponse(
-                    success=False,
-                    url=str(request.url),
-                    error_message=result.error_message
-                )
+        key = ("crawl", canonical_url(input_url))
+        response = await cached_crawl(CRAWL_CACHE, key, lambda: crawl_links(input_url))
+
+        # Serialize once; a response_model would re-validate every link first
+        return ORJSONResponse(response)
     except Exception as e:
-        print(f"Error in crawl_url: {str(e)}")  # Added logging
+        logger.exception("Error in crawl_url")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/markdown", response_model=MarkdownResponse)
-async def generate_markdown(request: MarkdownRequest, api_key: str = Depends(get_api_key)):
+@app.post(
+    "/markdown",
+    responses={200: {"model": MarkdownResponse, "content": {"text/markdown": {}}}}
+)
+async def generate_markdown(
+    request: MarkdownRequest,
+    output_format: Literal["json", "text"] = Query("json", alias="format"),
+    api_key: str = Depends(get_api_key)
+):
     """
     Generate markdown from a URL with content filtering.
+    With ?format=text the filtered markdown is returned as text/markdown instead of JSON
+    (failures are still reported as JSON).
+    Responses are cached per URL and filter settings for CRAWL_CACHE_TTL seconds
+    (pages over MARKDOWN_CACHE_MAX_CHARS are not cached).
     Requires a valid API key in the X-API-Key header.
     """
     try:
-        # Step 1: Create a pruning filter with the same configuration as fit_markdown.py
-        prune_filter = PruningContentFilter(
-            threshold=request.threshold,
-            threshold_type=request.threshold_type,
-            min_word_threshold=request.min_word_threshold
-        )
+        input_url = str(request.url)
 
-        # Step 2: Create markdown generator with the filter
-        md_generator = DefaultMarkdownGenerator(content_filter=prune_filter)
+        # Reuse the cached pruning filter / markdown generator configuration
+        config = markdown_config(
+            request.threshold,
+            request.threshold_type,
+            request.min_word_threshold
+        )
 
-        # Step 3: Configure crawler with the markdown generator
-        config = CrawlerRunConfig(
-            markdown_generator=md_generator
+        key = markdown_cache_key(
+            input_url,
+            request.threshold,
+            request.threshold_type,
+            request.min_word_threshold
+        )
+        response = await cached_crawl(
+            MARKDOWN_CACHE, key, lambda: crawl_markdown(input_url, config), markdown_cacheable
         )
 
-        # Run the crawler
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(str(request.url), config=config)
-
-            if result.success:
-                return MarkdownResponse(
-                    success=True,
-                    url=str(request.url),
-                    raw_markdown=result.markdown_v2.raw_markdown,
-                    fit_markdown=result.markdown_v2.fit_markdown,
-                    raw_markdown_length=len(result.markdown_v2.raw_markdown),
-                    fit_markdown_length=len(result.markdown_v2.fit_markdown)
-                )
-            else:
-                return MarkdownResponse(
-                    success=False,
-                    url=str(request.url),
-                    error_message=result.error_message
-                )
+        if output_format == "text" and response["success"]:
+            # The markdown is already in memory, so send it in one piece
+            return Response(response["fit_markdown"], media_type="text/markdown")
+
+        # The cached response is shared, so adapt a copy of its fields to this request;
+        # the markdown strings are referenced, not copied, and encoded once by orjson
+        body = dict(response)
+        body["url"] = input_url
+        if not request.include_markdown:
+            body["raw_markdown"] = body["fit_markdown"] = None
+        return ORJSONResponse(body)
 
     except Exception as e:
-        print(f"Error in generate_markdown: {str(e)}")  # Added logging
+        logger.exception("Error in generate_markdown")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/advanced", response_model=AdvancedResponse)
+async def discover_internal_urls(input_url: str) -> Tuple[Any, Set[str]]:
+    """
+    Crawl the input URL and collect the internal pages that are candidates for rendering.
+    Returns the crawl result and the normalized candidate URLs (excluding the
+    input URL itself); the URL set is empty if the initial crawl failed.
+    """
+    normalized_input_url = normalize_url(input_url)
+    logger.debug("Normalized input URL: %s", normalized_input_url)
+
+    # First get all internal links
+    logger.debug("Crawling for internal links...")
+    async with CRAWL_SEMAPHORE:
+        result = await app.state.crawler.arun(input_url, config=CRAWL_CONFIG)
+
+    if not result.success:
+        logger.warning("Failed to crawl initial URL %s: %s", input_url, result.error_message)
+        return result, set()
+
+    # Get unique internal links
+    candidate_urls = set()
+    for link in result.links.get("internal", []):
+        href_lower = link['href'].lower()
+        if _is_media_lower(href_lower):
+            continue
+        candidate_urls.add(_normalize_lower(href_lower))
+    candidate_urls.discard(normalized_input_url)
+
+    logger.debug("Found %d unique internal URLs to probe", len(candidate_urls))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("URLs to probe: %s", sorted(candidate_urls))
+
+    return result, candidate_urls
+
+async def render_page(
+    url: str,
+    filter_settings: Tuple[float, str, int],
+    include_markdown: bool = True
+) -> Optional[PageMarkdown]:
+    """
+    Generate markdown for a single URL, returning None if it fails.
+    A page requested by several concurrent /advanced calls is only rendered once.
+    With include_markdown=False only the markdown lengths are returned.
+    """
+    md_config = markdown_config(*filter_settings)
+    try:
+        logger.debug("Processing URL: %s", url)
+        body = await coalesced_render(
+            markdown_cache_key(url, *filter_settings),
+            lambda: crawl_markdown(url, md_config)
+        )
+    except Exception:
+        logger.exception("Error processing URL %s", url)
+        return None
+
+    if not body["success"]:
+        logger.warning("Failed to generate markdown for %s: %s", url, body["error_message"])
+        return None
+
+    logger.debug("Successfully generated markdown for %s", url)
+    return PageMarkdown(
+        url=url,  # Keep the original URL in the response
+        raw_markdown=body["raw_markdown"] if include_markdown else None,
+        fit_markdown=body["fit_markdown"] if include_markdown else None,
+        raw_markdown_length=body["raw_markdown_length"],
+        fit_markdown_length=body["fit_markdown_length"]
+    )
+
+async def probe_and_render(
+    url: str,
+    seen_urls: Set[str],
+    filter_settings: Tuple[float, str, int],
+    include_markdown: bool = True
+) -> Optional[PageMarkdown]:
+    """
+    Probe a candidate URL over plain HTTP and render it if it may be a live HTML page.
+    Returns None if the probe skips it or it redirects to a page already in seen_urls.
+    """
+    try:
+        probed_url = await probe_url(app.state.http_session, url)
+    except Exception as e:
+        # Treat anything unexpected like any other inconclusive probe
+        logger.debug("Probe inconclusive for %s, rendering anyway: %s", url, e)
+        probed_url = url
+    if probed_url is None:
+        return None
+
+    resolved_url = normalize_url(probed_url)
+    if resolved_url != url:
+        if resolved_url in seen_urls:
+            logger.debug("Skipping %s (redirects to %s)", url, resolved_url)
+            return None
+        seen_urls.add(resolved_url)
+    return await render_page(resolved_url, filter_settings, include_markdown)
+
+async def iter_pages(
+    input_url: str,
+    candidate_urls: Set[str],
+    filter_settings: Tuple[float, str, int],
+    include_markdown: bool = True
+) -> AsyncIterator[PageMarkdown]:
+    """
+    Render the input URL and the candidate URLs concurrently and yield pages in
+    completion order, skipping failed URLs. The input URL is rendered straight away;
+    each candidate is rendered as soon as its own probe passes.
+    Outstanding probes and renders are cancelled if the consumer stops early.
+    """
+    seen_urls = {input_url, *candidate_urls}
+    tasks = [asyncio.create_task(render_page(input_url, filter_settings, include_markdown))]
+    tasks.extend(
+        asyncio.create_task(probe_and_render(url, seen_urls, filter_settings, include_markdown))
+        for url in candidate_urls
+    )
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            page = await next_page
+            if page is not None:
+                yield page
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@app.post("/advanced", responses={200: {"model": AdvancedResponse}})
 async def advanced_crawl(request: AdvancedRequest, api_key: str = Depends(get_api_key)):
     """
     Advanced crawl that combines link discovery and markdown generation.
@@ -259,121 +698,92 @@ async def advanced_crawl(request: AdvancedRequest, api_key: str = Depends(get_ap
     Requires a valid API key in the X-API-Key header.
     """
     try:
-        print(f"Starting advanced crawl for URL: {request.url}")
-        
-        # First, crawl the URL to get internal links
-        crawler_cfg = CrawlerRunConfig(
-            exclude_external_links=False,
-            exclude_domains=[""],
-            exclude_social_media_links=False,
-            exclude_external_images=True,
-            wait_for_images=True,
-            verbose=True
+        input_url = str(request.url)
+        logger.debug("Starting advanced crawl for URL: %s", input_url)
+
+        filter_settings = (
+            request.threshold,
+            request.threshold_type,
+            request.min_word_threshold
         )
 
+        result, candidate_urls = await discover_internal_urls(input_url)
+        if not result.success:
+            return ORJSONResponse(AdvancedResponse(
+                success=False,
+                url=input_url,
+                error_message=f"Failed to crawl initial URL: {result.error_message}"
+            ).model_dump())
+
+        # Process URLs concurrently with controlled parallelism,
+        # collecting pages as they finish
+        pages = [
+            page async for page in
+            iter_pages(
+                normalize_url(input_url), candidate_urls,
+                filter_settings, request.include_markdown
+            )
+        ]
+
+        logger.debug("Successfully processed %d pages", len(pages))
+        return ORJSONResponse(AdvancedResponse.model_construct(
+            success=True,
+            url=input_url,
+            pages=pages
+        ).model_dump())
+
+    except Exception as e:
+        logger.exception("Error in advanced_crawl")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post(
+    "/advanced/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}}
+)
+async def advanced_crawl_stream(request: AdvancedRequest, api_key: str = Depends(get_api_key)):
+    """
+    Streaming variant of /advanced.
+    Returns one PageMarkdown JSON object per line (NDJSON) as each page completes.
+    If the initial crawl fails, returns the same JSON error body as /advanced.
+    Requires a valid API key in the X-API-Key header.
+    """
+    try:
         input_url = str(request.url)
-        print(f"Normalized input URL: {normalize_url(input_url)}")
-
-        # Create markdown generator configuration
-        print("Creating markdown generator configuration...")
-        prune_filter = PruningContentFilter(
-            threshold=request.threshold,
-            threshold_type=request.threshold_type,
-            min_word_threshold=request.min_word_threshold
-        )
-        md_generator = DefaultMarkdownGenerator(content_filter=prune_filter)
-        md_config = CrawlerRunConfig(
-            markdown_generator=md_generator,
-            verbose=True
+        logger.debug("Starting streaming advanced crawl for URL: %s", input_url)
+
+        filter_settings = (
+            request.threshold,
+            request.threshold_type,
+            request.min_word_threshold
         )
 
-        # Create a semaphore to limit concurrent requests
-        # Adjust this number based on your needs and server capacity
-        semaphore = asyncio.Semaphore(5)  # Process 5 URLs concurrently
-
-        print("Initializing crawler...")
-        async with AsyncWebCrawler() as crawler:
-            # First get all internal links
-            print("Crawling for internal links...")
-            result = await crawler.arun(input_url, config=crawler_cfg)
-            
-            if not result.success:
-                print(f"Failed to crawl initial URL: {result.error_message}")
-                return AdvancedResponse(
-                    success=False,
-                    url=input_url,
-                    error_message=f"Failed to crawl initial URL: {result.error_message}"
-                )
-
-            # Get unique internal links
-            internal_urls = {
-                normalize_url(link['href']) for link in result.links.get("internal", [])
-                if not is_media_url(link['href']) and not is_same_url(link['href'], input_url)
-            }
-            internal_urls.add(normalize_url(input_url))  # Include the original URL
-            
-            print(f"Found {len(internal_urls)} unique internal URLs to process")
-            print(f"URLs to process: {internal_urls}")
-
-            # Pre-warm the browser with a quick request
-            print("Pre-warming browser...")
-            await crawler.arun(input_url, config=md_config)
-
-            # Helper function to process a single URL with semaphore
-            async def process_url(url: str) -> Optional[PageMarkdown]:
-                async with semaphore:  # Limit concurrent requests
-                    try:
-                        print(f"Processing URL: {url}")
-                        md_result = await crawler.arun(url, config=md_config)
-                        if md_result.success:
-                            print(f"Successfully generated markdown for {url}")
-                            return PageMarkdown(
-                                url=url,  # Keep the original URL in the response
-                                raw_markdown=md_result.markdown_v2.raw_markdown,
-                                fit_markdown=md_result.markdown_v2.fit_markdown,
-                                raw_markdown_length=len(md_result.markdown_v2.raw_markdown),
-                                fit_markdown_length=len(md_result.markdown_v2.fit_markdown)
-                            )
-                        else:
-                            print(f"Failed to generate markdown for {url}: {md_result.error_message}")
-                            return None
-                    except Exception as e:
-                        print(f"Error processing URL {url}: {str(e)}")
-                        return None
-
-            # Process URLs concurrently with controlled parallelism
-            tasks = [process_url(url) for url in internal_urls]
-            results = await asyncio.gather(*tasks)
-            
-            # Filter out None results (failed URLs)
-            pages = [page for page in results if page is not None]
-
-            print(f"Successfully processed {len(pages)} pages")
-            return AdvancedResponse(
-                success=True,
+        result, candidate_urls = await discover_internal_urls(input_url)
+        if not result.success:
+            return ORJSONResponse(AdvancedResponse(
+                success=False,
                 url=input_url,
-                pages=pages
-            )
+                error_message=f"Failed to crawl initial URL: {result.error_message}"
+            ).model_dump())
 
     except Exception as e:
-        print(f"Error in advanced_crawl: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in advanced_crawl_stream")
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def ndjson_lines():
+        async for page in iter_pages(
+            normalize_url(input_url), candidate_urls,
+            filter_settings, request.include_markdown
+        ):
+            yield orjson.dumps(page.model_dump()) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
-    import socket
-    
-    # Get the host machine's IP address
-    hostname = socket.gethostname()
-    host_ip = socket.gethostbyname(hostname)
     
-    print(f"Starting API server...")
-    print(f"Server hostname: {hostname}")
-    print(f"Server IP: {host_ip}")
-    print(f"Documentation available at: http://{host_ip}:8002/docs")
+    print("Starting API server on 0.0.0.0:8002...")
+    print("Documentation available at: http://localhost:8002/docs")
     
     # Configure uvicorn with proxy settings and application import string
     uvicorn.run(
@@ -385,5 +795,10 @@ if __name__ == "__main__":
         forwarded_allow_ips="*",
         server_header=False,
         timeout_keep_alive=65,
-        workers=4
+        workers=4,
+        loop="uvloop",
+        http="httptools",
+        backlog=2048,
+        limit_concurrency=256,
+        timeout_graceful_shutdown=30
     ) 
@@ -1,18 +1,18 @@
-from fastapi import FastAPI, HTTPException, Security, Depends, APIRouter
+from fastapi import HTTPException, Security, Depends, APIRouter
 from fastapi.security.api_key import APIKeyHeader
 from starlette.status import HTTP_403_FORBIDDEN, HTTP_503_SERVICE_UNAVAILABLE
-from pyairtable.api.table import Table
-from typing import Optional
+from typing import Optional, List, Set
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 import sys
 import logging
-import requests
-import json
+import httpx
 
 # Configure logging to output to stdout
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[logging.StreamHandler(sys.stdout)]
 )
@@ -29,51 +29,128 @@ AIRTABLE_TABLE_NAME = os.getenv("AIRTABLE_TABLE_NAME", "").split('#')[0].strip()
 # Initialize router
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-# Initialize table as None, will be set during startup
-table = None
+AIRTABLE_URL = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
+
+# Initialize the Airtable client as None, will be set during startup
+airtable_client: Optional[httpx.AsyncClient] = None
+
+# Seconds to wait between Airtable initialization attempts
+AIRTABLE_RETRY_INTERVAL = float(os.getenv("AIRTABLE_RETRY_INTERVAL", "30"))
+
+# How long the in-process API key cache is served before a background refresh
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+
+# Valid API keys loaded from Airtable, refreshed in the background once stale
+api_keys: Set[str] = set()
+api_keys_loaded_at = 0.0
+_refresh_task: Optional[asyncio.Task] = None
+
+async def fetch_airtable_records(fields: Optional[List[str]] = None) -> List[dict]:
+    """Fetch every record in the Airtable table, following pagination."""
+    params = {"fields[]": fields} if fields else {}
+    records = []
+    while True:
+        response = await airtable_client.get(AIRTABLE_URL, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to access Airtable: {response.text}")
+
+        data = response.json()
+        records.extend(data.get('records', []))
+        if not data.get('offset'):
+            return records
+        params = {**params, "offset": data['offset']}
+
+async def refresh_api_keys() -> int:
+    """Reload the set of valid API keys from Airtable, returning the number of records read."""
+    global api_keys, api_keys_loaded_at
+
+    records = await fetch_airtable_records(fields=['API Key'])
+    api_keys = {
+        record.get('fields', {}).get('API Key', '') for record in records
+    } - {''}
+    api_keys_loaded_at = time.monotonic()
+    logger.debug("Loaded %d API keys from %d Airtable records", len(api_keys), len(records))
+    return len(records)
+
+async def _refresh_api_keys_in_background():
+    """Refresh the key cache, keeping the stale keys if Airtable is unavailable."""
+    try:
+        await refresh_api_keys()
+    except Exception as e:
+        logger.error("Error refreshing API keys: %s", e)
+
+def _schedule_api_key_refresh():
+    """Start a background refresh unless one is already running."""
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh_api_keys_in_background())
+
+def check_airtable_config():
+    """Fail fast if the Airtable environment variables are not set."""
+    if not all([AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME]):
+        raise ValueError("Missing required environment variables for Airtable configuration")
 
 async def init_airtable():
     """Initialize Airtable connection during startup."""
-    global table
+    global airtable_client
     
     logger.info("Initializing Airtable connection...")
-    logger.info(f"Table Name: '{AIRTABLE_TABLE_NAME}'")
-    logger.info(f"Base ID: '{AIRTABLE_BASE_ID}'")
-    logger.info(f"Airtable API Key: '{AIRTABLE_API_KEY[:5]}...'")
-
-    if not all([AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME]):
-        raise ValueError("Missing required environment variables for Airtable configuration")
+    logger.info("Table Name: '%s'", AIRTABLE_TABLE_NAME)
+    logger.info("Base ID: '%s'", AIRTABLE_BASE_ID)
+    logger.info("Airtable API Key: '%s...'", AIRTABLE_API_KEY[:5])
+    check_airtable_config()
 
     try:
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        base_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}"
-        logger.info(f"Testing Airtable connection: {base_url}")
-        
-        response = requests.get(base_url, headers=headers)
-        
-        if response.status_code == 200:
-            records = response.json().get('records', [])
-            logger.info(f"✓ Successfully connected to Airtable. Found {len(records)} records.")
-            
-            if records:
-                fields = records[0].get('fields', {})
-                logger.info(f"Available fields: {list(fields.keys())}")
-            
-            table = Table(AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
-            return True
-        else:
-            logger.error(f"✗ Failed to access table: {response.status_code}")
-            logger.error(f"Response: {response.text}")
-            raise Exception(f"Failed to access Airtable: {response.text}")
-            
+        # One async client for all Airtable calls, so they never block the event loop
+        # and reuse the same keep-alive connection (and TLS session) across refreshes;
+        # idle connections must outlive the refresh interval for that to happen
+        airtable_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=10,
+                max_keepalive_connections=4,
+                keepalive_expiry=API_KEY_CACHE_TTL + 30
+            ),
+            timeout=5.0,
+            headers={
+                "Authorization": f"Bearer {AIRTABLE_API_KEY}",
+                "Content-Type": "application/json"
+            }
+        )
+
+        # Loading the keys doubles as the connection test, so startup costs one round trip
+        logger.info("Loading API keys from Airtable: %s", AIRTABLE_URL)
+        record_count = await refresh_api_keys()
+        logger.info("✓ Successfully connected to Airtable. Found %d records.", record_count)
+        return True
+
     except Exception as e:
-        logger.error(f"Error connecting to Airtable: {str(e)}")
+        logger.error("Error connecting to Airtable: %s", e)
+        await close_airtable()
         raise
 
+async def init_airtable_in_background():
+    """
+    Initialize Airtable without holding up startup, retrying until it succeeds.
+    Protected endpoints return 503 until the API keys have been loaded.
+    Call check_airtable_config() first; only connection failures are retried.
+    """
+    while True:
+        try:
+            await init_airtable()
+            return
+        except Exception:
+            logger.info("Retrying Airtable initialization in %gs", AIRTABLE_RETRY_INTERVAL)
+            await asyncio.sleep(AIRTABLE_RETRY_INTERVAL)
+
+async def close_airtable():
+    """Close the Airtable client during shutdown."""
+    global airtable_client
+
+    if airtable_client is not None:
+        await airtable_client.aclose()
+        airtable_client = None
+
 # API Key header configuration
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -84,35 +161,23 @@ async def get_api_key(api_key_header: str = Security(api_key_header)) -> str:
             status_code=HTTP_403_FORBIDDEN, detail="No API key provided"
         )
     
-    try:
-        if table is None:
-            raise HTTPException(
-                status_code=HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Airtable connection not initialized"
-            )
-
-        # Get all records
-        all_records = table.all()
-        logger.debug(f"Found {len(all_records)} records in table")
-        
-        # Simple exact match check
-        for record in all_records:
-            fields = record.get('fields', {})
-            stored_key = fields.get('API Key', '')
-            if stored_key == api_key_header:
-                return api_key_header
-        
-        raise HTTPException(
-            status_code=HTTP_403_FORBIDDEN, detail="Invalid API key"
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error during validation: {str(e)}")
+    if airtable_client is None or not api_keys_loaded_at:
         raise HTTPException(
-            status_code=HTTP_403_FORBIDDEN, detail=f"Error validating API key: {str(e)}"
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Airtable connection not initialized"
         )
 
+    # Serve from the cache; if it is stale, refresh it without blocking this request
+    if time.monotonic() - api_keys_loaded_at > API_KEY_CACHE_TTL:
+        _schedule_api_key_refresh()
+
+    if api_key_header in api_keys:
+        return api_key_header
+
+    raise HTTPException(
+        status_code=HTTP_403_FORBIDDEN, detail="Invalid API key"
+    )
+
 @router.get("/validate-key")
 async def validate_api_key(api_key: str = Depends(get_api_key)):
     """Endpoint to validate an API key."""